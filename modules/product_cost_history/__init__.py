@@ -3,7 +3,7 @@
 
 from trytond.pool import Pool
 
-from . import product
+from . import product, stock
 
 __all__ = ['register']
 
@@ -13,4 +13,5 @@ def register():
         product.Product,
         product.CostPrice,
         product.ProductCostHistory,
+        stock.Move,
         module='product_cost_history', type_='model')
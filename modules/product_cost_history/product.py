@@ -5,7 +5,7 @@ from sql.aggregate import Max
 from sql.conditionals import Coalesce
 from sql.functions import CurrentTimestamp, LastValue
 
-from trytond.model import ModelSQL, ModelView, convert_from, fields
+from trytond.model import Index, ModelSQL, ModelView, convert_from, fields
 from trytond.modules.product import round_price
 from trytond.pool import Pool, PoolMeta
 from trytond.tools import timezone as tz
@@ -59,6 +59,17 @@ class CostPrice(metaclass=PoolMeta):
     __name__ = 'product.cost_price'
     _history = True
 
+    @classmethod
+    def __setup__(cls):
+        super().__setup__()
+        h = cls.__table_history__()
+        cls._sql_indexes.add(
+            Index(
+                h,
+                (h.company, Index.Equality()),
+                (h.product, Index.Range()),
+                (Coalesce(h.write_date, h.create_date), Index.Range())))
+
 
 class ProductCostHistory(ModelSQL, ModelView):
     'History of Product Cost'
@@ -7,6 +7,7 @@ from itertools import chain, groupby
 
 from sql import Literal, Null
 from sql.aggregate import Count
+from sql.conditionals import Case
 from sql.functions import CharLength
 from sql.operators import Concat
 
@@ -240,7 +241,11 @@ class Purchase(
         t = cls.__table__()
         cls._sql_indexes.update({
                 Index(t, (t.reference, Index.Similarity())),
-                Index(t, (t.party, Index.Equality())),
+                Index(
+                    t,
+                    (t.party, Index.Equality()),
+                    (t.invoice_party, Index.Equality()),
+                    (t.id, Index.Range())),
                 Index(
                     t,
                     (t.state, Index.Equality()),
@@ -249,11 +254,17 @@ class Purchase(
                 Index(
                     t,
                     (t.invoice_state, Index.Equality()),
-                    where=t.state.in_(['none', 'waiting', 'exception'])),
+                    where=t.invoice_state.in_(
+                        ['none', 'pending', 'exception'])),
                 Index(
                     t,
                     (t.shipment_state, Index.Equality()),
-                    where=t.state.in_(['none', 'waiting', 'exception'])),
+                    where=t.shipment_state.in_(
+                        ['none', 'waiting', 'exception'])),
+                Index(
+                    t,
+                    (t.purchase_date, Index.Range(order='DESC NULLS FIRST')),
+                    (t.id, Index.Range(order='DESC'))),
                 })
         cls._order = [
             ('purchase_date', 'DESC NULLS FIRST'),
@@ -376,14 +387,17 @@ class Purchase(
                     where=sql_table.id.in_(sub_query.select(sub_query.id))))
 
         # Migration from 5.6: rename state cancel to cancelled
-        cursor.execute(*sql_table.update(
-                [sql_table.state], ['cancelled'],
-                where=sql_table.state == 'cancel'))
-
         # Migration from 6.6: rename invoice state waiting to pending
         cursor.execute(*sql_table.update(
-                [sql_table.invoice_state], ['pending'],
-                where=sql_table.invoice_state == 'waiting'))
+                [sql_table.state, sql_table.invoice_state],
+                [Case(
+                        (sql_table.state == 'cancel', 'cancelled'),
+                        else_=sql_table.state),
+                    Case(
+                        (sql_table.invoice_state == 'waiting', 'pending'),
+                        else_=sql_table.invoice_state)],
+                where=(sql_table.state == 'cancel')
+                | (sql_table.invoice_state == 'waiting')))
 
     @classmethod
     def order_number(cls, tables):
@@ -605,17 +619,18 @@ class Purchase(
         '''
         Return the invoice state for the purchase.
         '''
-        skips = set(self.invoices_ignored)
-        skips.update(self.invoices_recreated)
-        invoices = [i for i in self._invoices_for_state if i.id not in skips]
-        if invoices:
-            if any(i.state == 'cancelled' for i in invoices):
+        skip_ids = {i.id for i in chain(
+                self.invoices_ignored, self.invoices_recreated)}
+        states = {
+            i.state for i in self._invoices_for_state if i.id not in skip_ids}
+        if states:
+            if 'cancelled' in states:
                 return 'exception'
-            elif all(i.state == 'paid' for i in invoices):
+            elif states == {'paid'}:
                 return 'paid'
-            elif any(i.state == 'paid' for i in invoices):
+            elif 'paid' in states:
                 return 'partially paid'
-            elif any(i.state == 'posted' for i in invoices):
+            elif 'posted' in states:
                 return 'awaiting payment'
             else:
                 return 'pending'
@@ -635,10 +650,12 @@ class Purchase(
         if self.moves:
             if any(l.moves_exception for l in self.lines):
                 return 'exception'
-            elif all(l.moves_progress >= 1 for l in self.lines
-                    if l.moves_progress is not None):
+            progresses = [
+                p for p in (l.moves_progress for l in self.lines)
+                if p is not None]
+            if all(p >= 1 for p in progresses):
                 return 'received'
-            elif any(l.moves_progress for l in self.lines):
+            elif any(progresses):
                 return 'partially shipped'
             else:
                 return 'waiting'
@@ -745,10 +762,13 @@ class Purchase(
         return super(Purchase, cls).copy(purchases, default=default)
 
     def check_for_quotation(self):
+        pool = Pool()
+        Line = pool.get('purchase.line')
+        product_types = Line.get_move_product_types()
         for line in self.lines:
-            if (not line.to_location
-                    and line.product
-                    and line.product.type in line.get_move_product_types()):
+            if (line.product
+                    and line.product.type in product_types
+                    and not line.to_location):
                 raise PurchaseQuotationError(
                     gettext('purchase.msg_warehouse_required_for_quotation',
                         purchase=self.rec_name))
@@ -772,19 +792,28 @@ class Purchase(
     @classmethod
     def set_purchase_date(cls, purchases):
         Date = Pool().get('ir.date')
-        for company, purchases in groupby(purchases, key=lambda p: p.company):
+        purchases = sorted(
+            (p for p in purchases if not p.purchase_date),
+            key=lambda p: p.company.id)
+        to_write = []
+        for company, c_purchases in groupby(
+                purchases, key=lambda p: p.company):
             with Transaction().set_context(company=company.id):
                 today = Date.today()
-            cls.write([p for p in purchases if not p.purchase_date], {
-                    'purchase_date': today,
-                    })
+            to_write.extend([list(c_purchases), {
+                        'purchase_date': today,
+                        }])
+        if to_write:
+            cls.write(*to_write)
 
     @classmethod
     def store_cache(cls, purchases):
         for purchase in purchases:
-            purchase.untaxed_amount_cache = purchase.untaxed_amount
-            purchase.tax_amount_cache = purchase.tax_amount
-            purchase.total_amount_cache = purchase.total_amount
+            for name in ['untaxed_amount', 'tax_amount', 'total_amount']:
+                value = getattr(purchase, name)
+                # Do not write unchanged amounts
+                if getattr(purchase, name + '_cache') != value:
+                    setattr(purchase, name + '_cache', value)
         cls.save(purchases)
 
     def _get_invoice_purchase(self):
@@ -812,8 +841,7 @@ class Purchase(
 
         invoice_lines = []
         for line in self.lines:
-            invoice_lines.append(line.get_invoice_line())
-        invoice_lines = list(chain(*invoice_lines))
+            invoice_lines.extend(line.get_invoice_line())
         if not invoice_lines:
             return
 
@@ -1306,6 +1334,11 @@ class Line(sequence_ordered(), ModelSQL, ModelView):
     def __setup__(cls):
         super().__setup__()
         cls.__access__.add('purchase')
+        t = cls.__table__()
+        cls._sql_indexes.add(
+            Index(
+                t, (t.purchase, Index.Equality()),
+                where=t.type == 'line'))
         cls._order.insert(0, ('purchase.purchase_date', 'DESC NULLS FIRST'))
         cls._order.insert(1, ('purchase.id', 'DESC'))
 
@@ -1350,10 +1383,12 @@ class Line(sequence_ordered(), ModelSQL, ModelView):
         return quantity
 
     def get_moves_exception(self, name):
+        cancelled = [m for m in self.moves if m.state == 'cancelled']
+        if not cancelled:
+            return False
         skips = set(self.moves_ignored)
         skips.update(self.moves_recreated)
-        return any(
-            m.state == 'cancelled' for m in self.moves if m not in skips)
+        return any(m not in skips for m in cancelled)
 
     def get_moves_progress(self, name):
         progress = None
@@ -1517,21 +1552,30 @@ class Line(sequence_ordered(), ModelSQL, ModelView):
             return amount
         return Decimal('0.0')
 
-    def get_amount(self, name):
-        if self.type == 'line':
-            return self.on_change_with_amount()
-        elif self.type == 'subtotal':
+    @classmethod
+    def get_amount(cls, lines, name):
+        amounts = {}
+        subtotals = set()
+        purchases = set()
+        for line in lines:
+            if line.type == 'line':
+                amounts[line.id] = line.on_change_with_amount()
+            elif line.type == 'subtotal':
+                subtotals.add(line.id)
+                purchases.add(line.purchase)
+            else:
+                amounts[line.id] = Decimal('0.0')
+        # Compute all the subtotals of a purchase in a single pass
+        for purchase in purchases:
             amount = Decimal('0.0')
-            for line2 in self.purchase.lines:
-                if line2.type == 'line':
-                    amount += line2.purchase.currency.round(
-                        Decimal(str(line2.quantity)) * line2.unit_price)
-                elif line2.type == 'subtotal':
-                    if self == line2:
-                        break
+            for line in purchase.lines:
+                if line.type == 'line':
+                    amount += line.on_change_with_amount()
+                elif line.type == 'subtotal':
+                    if line.id in subtotals:
+                        amounts[line.id] = amount
                     amount = Decimal('0.0')
-            return amount
-        return Decimal('0.0')
+        return amounts
 
     @fields.depends('purchase', '_parent_purchase.warehouse')
     def on_change_with_warehouse(self, name=None):
@@ -1583,31 +1627,34 @@ class Line(sequence_ordered(), ModelSQL, ModelView):
         pool = Pool()
         Date = pool.get('ir.date')
         ProductSupplier = pool.get('purchase.product_supplier')
-        if self.purchase and self.purchase.company:
-            with Transaction().set_context(company=self.purchase.company.id):
-                today = Date.today()
-        else:
-            today = Date.today()
-        product_supplier = self.product_supplier
-        if not product_supplier and self.purchase and self.purchase.company:
-            product_supplier = ProductSupplier(
-                party=self.purchase.party,
-                company=self.purchase.company)
         delivery_date = None
         if self.delivery_date_edit:
             delivery_date = self.delivery_date_store
         elif self.purchase and self.purchase.delivery_date:
             delivery_date = self.purchase.delivery_date
-        elif (product_supplier
-                and self.quantity is not None
+        elif (self.quantity is not None
                 and self.quantity > 0
                 and self.purchase):
-            date = self.purchase.purchase_date if self.purchase else None
-            delivery_date = product_supplier.compute_supply_date(date=date)
-            if delivery_date == datetime.date.max:
+            product_supplier = self.product_supplier
+            if not product_supplier and self.purchase.company:
+                product_supplier = ProductSupplier(
+                    party=self.purchase.party,
+                    company=self.purchase.company)
+            if product_supplier:
+                date = self.purchase.purchase_date
+                delivery_date = product_supplier.compute_supply_date(
+                    date=date)
+                if delivery_date == datetime.date.max:
+                    delivery_date = None
+        if delivery_date:
+            if self.purchase and self.purchase.company:
+                with Transaction().set_context(
+                        company=self.purchase.company.id):
+                    today = Date.today()
+            else:
+                today = Date.today()
+            if delivery_date < today:
                 delivery_date = None
-        if delivery_date and delivery_date < today:
-            delivery_date = None
         return delivery_date
 
     @classmethod
@@ -1751,10 +1798,11 @@ class Line(sequence_ordered(), ModelSQL, ModelView):
         Uom = pool.get('product.uom')
 
         quantity = 0
+        invoice_lines = [l for l in self.invoice_lines if l.type == 'line']
+        if not invoice_lines:
+            return quantity
         skips = {l for i in self.purchase.invoices_recreated for l in i.lines}
-        for invoice_line in self.invoice_lines:
-            if invoice_line.type != 'line':
-                continue
+        for invoice_line in invoice_lines:
             if invoice_line not in skips:
                 quantity += Uom.compute_qty(invoice_line.unit,
                     invoice_line.quantity, self.unit)
@@ -2010,8 +2058,7 @@ class OpenSupplier(Wizard):
         cursor = Transaction().connection.cursor()
         purchase = Purchase.__table__()
 
-        cursor.execute(*purchase.select(purchase.party,
-                group_by=purchase.party))
+        cursor.execute(*purchase.select(purchase.party, distinct=True))
         supplier_ids = [line[0] for line in cursor]
         action['pyson_domain'] = PYSONEncoder().encode(
             [('id', 'in', supplier_ids)])
@@ -2046,7 +2093,7 @@ class HandleShipmentException(Wizard):
     def default_ask(self, fields):
         moves = []
         for line in self.record.lines:
-            skip = set(line.moves_ignored + line.moves_recreated)
+            skip = set(chain(line.moves_ignored, line.moves_recreated))
             for move in line.moves:
                 if move.state == 'cancelled' and move not in skip:
                     moves.append(move.id)
@@ -2058,9 +2105,10 @@ class HandleShipmentException(Wizard):
     def transition_handle(self):
         pool = Pool()
         PurchaseLine = pool.get('purchase.line')
-        to_recreate = self.ask.recreate_moves
-        domain_moves = self.ask.domain_moves
+        to_recreate = set(self.ask.recreate_moves)
+        domain_moves = set(self.ask.domain_moves)
 
+        to_write = []
         for line in self.record.lines:
             moves_ignored = []
             moves_recreated = []
@@ -2074,10 +2122,13 @@ class HandleShipmentException(Wizard):
                 else:
                     moves_ignored.append(move.id)
 
-            PurchaseLine.write([line], {
-                'moves_ignored': [('add', moves_ignored)],
-                'moves_recreated': [('add', moves_recreated)],
-                })
+            if moves_ignored or moves_recreated:
+                to_write.extend(([line], {
+                            'moves_ignored': [('add', moves_ignored)],
+                            'moves_recreated': [('add', moves_recreated)],
+                            }))
+        if to_write:
+            PurchaseLine.write(*to_write)
 
         self.model.__queue__.process([self.record])
         return 'end'
@@ -2121,8 +2172,9 @@ class HandleInvoiceException(Wizard):
     def transition_handle(self):
         invoices_ignored = []
         invoices_recreated = []
+        to_recreate = set(self.ask.recreate_invoices)
         for invoice in self.ask.domain_invoices:
-            if invoice in self.ask.recreate_invoices:
+            if invoice in to_recreate:
                 invoices_recreated.append(invoice.id)
             else:
                 invoices_ignored.append(invoice.id)
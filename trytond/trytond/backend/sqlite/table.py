@@ -337,10 +337,10 @@ class TableHandler(TableHandlerInterface):
                 name = 'idx_' + self.convert_name(name, reserved=len('idx_'))
                 if not params:
                     file.write(
-                        'CREATE INDEX IF NOT EXISTS %s ON %s %s;' % (
-                            _escape_identifier(name),
-                            _escape_identifier(self.table_name),
-                            query).encode('utf8'))
+                        ('CREATE INDEX IF NOT EXISTS %s ON %s %s;\n' % (
+                                _escape_identifier(name),
+                                _escape_identifier(self.table_name),
+                                query)).encode('utf8'))
                 else:
                     warnings.warn("Can not create index with parameters")
 
@@ -481,18 +481,34 @@ class ModelSQL(ModelStorage):
                     cursor.execute(*h_table.update(
                             [h_table.write_date], [None]))
 
+    @classmethod
+    def _sql_indexes_of(cls, history=False):
+        "Return the SQL indexes defined on the table or its history"
+        table_name = cls._table
+        if history:
+            table_name += '__history'
+        return {i for i in cls._sql_indexes if i.table._name == table_name}
+
     @classmethod
     def _update_sql_indexes(cls, concurrently):
         if not callable(cls.table_query):
             table_h = cls.__table_handler__()
             # TODO: remove overlapping indexes
-            table_h.set_indexes(cls._sql_indexes, concurrently)
+            table_h.set_indexes(cls._sql_indexes_of(), concurrently)
+            if cls._history:
+                history_h = cls.__table_handler__(history=True)
+                history_h.set_indexes(
+                    cls._sql_indexes_of(history=True), concurrently)
 
     @classmethod
     def _dump_sql_indexes(cls, file, concurrently):
         if not callable(cls.table_query):
             table_h = cls.__table_handler__()
-            table_h.dump_indexes(cls._sql_indexes, file, concurrently)
+            table_h.dump_indexes(cls._sql_indexes_of(), file, concurrently)
+            if cls._history:
+                history_h = cls.__table_handler__(history=True)
+                history_h.dump_indexes(
+                    cls._sql_indexes_of(history=True), file, concurrently)
 
     @classmethod
     def _update_history_table(cls):
@@ -1,6 +1,7 @@
 # This file is part of Tryton.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
 import datetime
+import io
 import unittest
 
 from trytond import backend
@@ -10,6 +11,12 @@ from trytond.tests.test_tryton import activate_module, with_transaction
 from trytond.transaction import Transaction
 
 
+def _index_name(table_h, index):
+    name, _, _ = table_h.index_translator_for(index).definition(index)
+    name = '_'.join([table_h.table_name, name])
+    return 'idx_' + table_h.convert_name(name, reserved=len('idx_'))
+
+
 class HistoryTestCase(unittest.TestCase):
     'Test History'
 
@@ -76,6 +83,52 @@ class HistoryTestCase(unittest.TestCase):
             with self.assertRaises(AccessError):
                 History.read([history_id], ['value'])
 
+    @with_transaction()
+    def test_sql_indexes_history(self):
+        "Test SQL indexes of history table"
+        pool = Pool()
+        History = pool.get('test.history')
+        history_table = History.__table_history__()
+
+        indexes = History._sql_indexes_of(history=True)
+
+        self.assertTrue(indexes)
+        self.assertTrue(all(
+                i.table._name == history_table._name for i in indexes))
+        self.assertFalse(indexes & History._sql_indexes_of())
+
+    @with_transaction()
+    def test_update_sql_indexes_history(self):
+        "Test update SQL indexes creates history indexes on history table"
+        pool = Pool()
+        History = pool.get('test.history')
+
+        History._update_sql_indexes(concurrently=False)
+
+        table_h = History.__table_handler__()
+        history_h = History.__table_handler__(history=True)
+        for index in History._sql_indexes_of(history=True):
+            self.assertIn(
+                _index_name(history_h, index), history_h._indexes)
+            self.assertNotIn(
+                _index_name(table_h, index), table_h._indexes)
+
+    @with_transaction()
+    def test_dump_sql_indexes_history(self):
+        "Test dump SQL indexes creates history indexes on history table"
+        pool = Pool()
+        History = pool.get('test.history')
+        table_h = History.__table_handler__()
+        history_h = History.__table_handler__(history=True)
+
+        with io.BytesIO() as file:
+            History._dump_sql_indexes(file, concurrently=False)
+            dump = file.getvalue().decode('utf-8')
+
+        for index in History._sql_indexes_of(history=True):
+            self.assertIn(_index_name(history_h, index), dump)
+            self.assertNotIn(_index_name(table_h, index), dump)
+
     @unittest.skipUnless(backend.name == 'postgresql',
         'CURRENT_TIMESTAMP as transaction_timestamp is specific to postgresql')
     @with_transaction()